@@ -1,14 +1,16 @@
 # Provides FastAPI dependencies for handling Supabase authentication
 # and accessing the Supabase client.
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Header, status
 from fastapi.security import OAuth2PasswordBearer
 from typing import Dict, Any, Optional
 from supabase import Client
 import logging
 
 from app.core.security import verify_supabase_jwt
+from app.core.profiling import is_valid_profile_token
 from app.db.supabase_client import get_supabase_client as get_db_client # Renamed for clarity
+from app.db.guest_store import GuestHistoryStore, get_guest_store as get_guest_history_store
 
 logger = logging.getLogger(__name__)
 
@@ -60,11 +62,33 @@ async def get_current_user_id(payload: Dict[str, Any] = Depends(get_verified_tok
          )
     return user_id
 
+async def get_is_anonymous(payload: Dict[str, Any] = Depends(get_verified_token_payload)) -> bool:
+    """
+    Dependency returning whether the current user is an anonymous guest.
+    Reads the 'is_anonymous' claim Supabase puts in anonymous users' JWTs.
+    Used to select the storage tier (guest tier for guests, Supabase otherwise).
+    """
+    return payload.get("is_anonymous") is True
+
 # Dependency to get the Supabase client instance
 def get_supabase_client() -> Client:
     """Provides the Supabase client instance."""
     return get_db_client()
 
+# Dependency to get the Redis-backed guest history store
+def get_guest_store() -> GuestHistoryStore:
+    """Provides the guest (anonymous) history store instance."""
+    return get_guest_history_store()
+
+async def require_profiling_token(x_profile_token: Optional[str] = Header(None)) -> None:
+    """
+    Dependency guarding the profiling endpoints with the PROFILING_TOKEN secret.
+    Responds 404 rather than 401 so the endpoints are not discoverable.
+    """
+    if not is_valid_profile_token(x_profile_token):
+        logger.info("Profiling access denied: missing or invalid X-Profile-Token.")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
 # Optional: Dependency to specifically require a non-anonymous user
 # async def get_current_authenticated_user_id(payload: Dict[str, Any] = Depends(get_verified_token_payload)) -> str:
 #     """
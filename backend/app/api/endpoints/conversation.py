@@ -1,42 +1,49 @@
 # API endpoints for managing conversations and messages.
 # Uses Supabase for auth via dependencies and interacts with ConversationService.
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body
-from app.api.deps import get_supabase_client, get_current_user_id # Use new deps
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Body, Query
+from app.api.deps import get_supabase_client, get_current_user_id, get_is_anonymous, get_guest_store # Use new deps
+from app.db.guest_store import GuestHistoryStore
 from app.services.conversation import ConversationService
 # Adapt schemas as needed for request/response bodies
-from app.schemas.conversation import ConversationResponse, MessageCreatePayload, ConversationListResponse
+from app.schemas.conversation import ConversationResponse, MessageCreatePayload, ConversationListResponse, GuestPromotionResponse, SearchResponse
 from supabase import Client
 import structlog
-from typing import List
+from typing import List, Optional
 
 logger = structlog.get_logger(__name__)
 router = APIRouter()
 
 # Initialize ConversationService with Supabase client dependency
 # This could also be done within each endpoint if preferred
-def get_conversation_service(client: Client = Depends(get_supabase_client)) -> ConversationService:
-    return ConversationService(supabase_client=client)
+def get_conversation_service(
+    client: Client = Depends(get_supabase_client),
+    guest_store: GuestHistoryStore = Depends(get_guest_store),
+) -> ConversationService:
+    return ConversationService(supabase_client=client, guest_store=guest_store)
 
 
 @router.post("/message", response_model=ConversationResponse)
 async def create_message(
+    background_tasks: BackgroundTasks,
     # Use a Pydantic model for the request body for validation
     payload: MessageCreatePayload = Body(...),
-    background_tasks: BackgroundTasks,
     user_id: str = Depends(get_current_user_id), # Get user ID from verified Supabase token
+    is_anonymous: bool = Depends(get_is_anonymous), # Selects guest (Redis-backed) or Supabase storage
     service: ConversationService = Depends(get_conversation_service), # Inject service
 ):
     """
     Processes a new message from the user, creates a conversation if needed,
     gets an AI response, and saves the turn.
+    Guest turns are kept in the Redis-backed guest tier until the guest registers.
     """
     logger.info("Received request to /message endpoint.", user_id=user_id, conversation_id=payload.conversation_id)
     try:
         response = await service.process_message(
             user_id=user_id,
             conversation_id=payload.conversation_id,
-            message_content=payload.message
+            message_content=payload.message,
+            is_anonymous=is_anonymous
         )
 
         # Optional: Add background task for interaction tracking
@@ -70,6 +77,7 @@ async def create_message(
 @router.get("/conversations", response_model=List[ConversationListResponse])
 async def get_conversations_list(
     user_id: str = Depends(get_current_user_id),
+    is_anonymous: bool = Depends(get_is_anonymous),
     service: ConversationService = Depends(get_conversation_service),
 ):
     """
@@ -77,7 +85,7 @@ async def get_conversations_list(
     """
     logger.info("Received request to /conversations endpoint.", user_id=user_id)
     try:
-        conversations = await service.get_user_conversations(user_id=user_id)
+        conversations = await service.get_user_conversations(user_id=user_id, is_anonymous=is_anonymous)
         # Map DB result to response schema if necessary
         return conversations # Assuming service returns data compatible with ConversationListResponse
     except HTTPException:
@@ -90,5 +98,69 @@ async def get_conversations_list(
         )
 
 
+@router.get("/conversations/search", response_model=SearchResponse)
+async def search_conversations(
+    q: str = Query(..., min_length=1, max_length=200),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=50),
+    user_id: str = Depends(get_current_user_id),
+    is_anonymous: bool = Depends(get_is_anonymous),
+    service: ConversationService = Depends(get_conversation_service),
+):
+    """
+    Searches the current user's own messages, ranked by relevance with snippets.
+    Pass the returned next_cursor to fetch the following page.
+    Registered users are searched with Postgres websearch syntax (stemmed words,
+    OR and "quoted phrases"). Guest history is searched in the guest store, which
+    stems words approximately and requires every word: OR and quotes are not supported.
+    """
+    logger.info("Received request to /conversations/search endpoint.", user_id=user_id)
+    try:
+        return await service.search_messages(
+            user_id=user_id,
+            query=q,
+            limit=limit,
+            cursor=cursor,
+            is_anonymous=is_anonymous
+        )
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error searching conversations", user_id=user_id, error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to search conversations."
+        )
+
+
+@router.post("/conversations/promote", response_model=GuestPromotionResponse)
+async def promote_guest_conversations(
+    user_id: str = Depends(get_current_user_id),
+    is_anonymous: bool = Depends(get_is_anonymous),
+    service: ConversationService = Depends(get_conversation_service),
+):
+    """
+    Moves the caller's guest history into Supabase after they register.
+    Must be called with the registered (non-anonymous) user's token; Supabase
+    keeps the same user ID when an anonymous user is converted.
+    """
+    logger.info("Received request to /conversations/promote endpoint.", user_id=user_id)
+    if is_anonymous:
+        raise HTTPException(status_code=403, detail="Requires authenticated user")
+    try:
+        promoted = await service.promote_guest_history(user_id=user_id)
+        return GuestPromotionResponse(promoted_conversations=promoted)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error promoting guest conversations", user_id=user_id, error=str(e))
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to save guest conversations."
+        )
+
+
 # Add endpoints for DELETE /conversations/{conversation_id}, etc. as needed
 # Ensure they use get_current_user_id and call appropriate service methods. 
\ No newline at end of file
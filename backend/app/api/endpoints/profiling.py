@@ -0,0 +1,44 @@
+# Debug endpoints for listing and downloading captured request profiles.
+# All endpoints require the X-Profile-Token header (see PROFILING_TOKEN).
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+from app.api.deps import require_profiling_token
+from app.core.profiling import ProfileStore, get_profile_store, render_speedscope
+from app.schemas.profiling import ProfileSummary
+import structlog
+from typing import List
+
+logger = structlog.get_logger(__name__)
+router = APIRouter(dependencies=[Depends(require_profiling_token)])
+
+
+@router.get("/profiles", response_model=List[ProfileSummary])
+async def list_profiles(store: ProfileStore = Depends(get_profile_store)):
+    """
+    Lists the slowest captured request profiles, slowest first.
+    """
+    return store.list()
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, store: ProfileStore = Depends(get_profile_store)):
+    """
+    Downloads a captured profile as speedscope JSON.
+    Open it at https://www.speedscope.app to view it as a flamegraph.
+    """
+    capture = store.get(profile_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    logger.info("Downloading request profile.", profile_id=profile_id, path=capture["path"])
+    return Response(
+        content=render_speedscope(capture),
+        media_type="application/json",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.speedscope.json"'},
+    )
+
+@router.delete("/profiles", status_code=204)
+async def clear_profiles(store: ProfileStore = Depends(get_profile_store)):
+    """
+    Discards all captured profiles.
+    """
+    store.clear()
+    return Response(status_code=204)
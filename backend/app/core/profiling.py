@@ -0,0 +1,156 @@
+# On-demand request profiling using pyinstrument's async-aware sampling profiler.
+# Requests are profiled at PROFILING_SAMPLE_RATE, or when they carry a valid
+# X-Profile-Token header. The slowest PROFILING_MAX_CAPTURES profiles are kept
+# in memory and can be downloaded as speedscope (flamegraph) JSON.
+
+from typing import Dict, List, Any, Optional
+from datetime import datetime, timezone
+from app.core.config import settings
+import heapq
+import hmac
+import itertools
+import logging
+import random
+import threading
+import uuid
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.frame import AWAIT_FRAME_IDENTIFIER
+    from pyinstrument.renderers import SpeedscopeRenderer
+    PYINSTRUMENT_AVAILABLE = True
+except ImportError:  # Optional dependency (install the 'profiling' extra)
+    PYINSTRUMENT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOKEN_HEADER = "x-profile-token"
+
+
+def is_valid_profile_token(token: Optional[str]) -> bool:
+    """Constant-time check of a token against PROFILING_TOKEN (never valid if unset)."""
+    if not settings.PROFILING_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), settings.PROFILING_TOKEN.encode())
+
+
+def _await_time(frame) -> float:
+    """Sums the time spent suspended in 'await' within the request's own task."""
+    if frame is None:
+        return 0.0
+    if frame.identifier == AWAIT_FRAME_IDENTIFIER:
+        return frame.time
+    return sum(_await_time(child) for child in frame.children)
+
+
+class ProfileStore:
+    """Keeps the slowest N request profiles (min-heap on wall time)."""
+
+    def __init__(self, max_captures: int):
+        self.max_captures = max_captures
+        self._heap: List[tuple] = []  # (wall_time, seq, capture)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, capture: Dict[str, Any]) -> None:
+        entry = (capture["wall_ms"], next(self._counter), capture)
+        with self._lock:
+            if len(self._heap) < self.max_captures:
+                heapq.heappush(self._heap, entry)
+            elif entry[0] > self._heap[0][0]:
+                # Drop the fastest capture to make room for a slower one
+                heapq.heapreplace(self._heap, entry)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Returns capture summaries, slowest first (without the raw session)."""
+        with self._lock:
+            captures = [entry[2] for entry in sorted(self._heap, key=lambda e: e[0], reverse=True)]
+        return [{k: v for k, v in c.items() if k != "session"} for c in captures]
+
+    def get(self, capture_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            for _, _, capture in self._heap:
+                if capture["id"] == capture_id:
+                    return capture
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+
+profile_store = ProfileStore(max_captures=settings.PROFILING_MAX_CAPTURES)
+
+def get_profile_store() -> ProfileStore:
+    """Dependency function to get the profile store."""
+    return profile_store
+
+
+def render_speedscope(capture: Dict[str, Any]) -> str:
+    """Renders a capture as speedscope JSON (open at https://www.speedscope.app)."""
+    return SpeedscopeRenderer().render(capture["session"])
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles a sample of HTTP requests.
+
+    Rendering is deferred until a profile is downloaded, so the request path only
+    pays for sampling and a few summary numbers. Profiling runs inside the
+    request's task with async_mode enabled, so concurrent requests do not show
+    up in each other's profiles; time spent awaiting I/O appears as [await] frames.
+    """
+
+    def __init__(self, app, store: ProfileStore):
+        self.app = app
+        self.store = store
+
+    def _should_profile(self, scope) -> bool:
+        if scope["type"] != "http":
+            return False
+        if scope["path"].startswith(f"{settings.API_V1_STR}/debug/profiles"):
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_TOKEN_HEADER.encode():
+                return is_valid_profile_token(value.decode("latin-1"))
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = datetime.now(timezone.utc)
+        profiler = Profiler(interval=settings.PROFILING_INTERVAL_SECONDS, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            session = profiler.stop()
+            try:
+                await_seconds = _await_time(session.root_frame())
+                self.store.add({
+                    "id": str(uuid.uuid4()),
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status_code": status_code,
+                    "started_at": started_at,
+                    "wall_ms": session.duration * 1000,
+                    # Whole-process CPU, so concurrent requests are included
+                    "process_cpu_ms": session.cpu_time * 1000,
+                    "await_ms": await_seconds * 1000,
+                    "active_ms": max(session.duration - await_seconds, 0.0) * 1000,
+                    "sample_count": session.sample_count,
+                    "session": session,
+                })
+            except Exception as e:
+                # Never fail a request because of profiling
+                logger.error(f"Failed to record request profile: {e}", exc_info=True)
@@ -119,8 +119,9 @@ async def verify_supabase_jwt(token: str) -> Dict[str, Any]:
             logger.info(f"Token expired for user {user_id}.")
             raise token_expired_exception
 
-        # Add is_anonymous flag for convenience
-        payload["is_anonymous"] = (role == "anon")
+        # Supabase anonymous users get role 'authenticated' plus an 'is_anonymous' claim;
+        # keep that claim (and treat the 'anon' role as anonymous too)
+        payload["is_anonymous"] = payload.get("is_anonymous") is True or role == "anon"
 
         logger.debug(f"JWT verified successfully for user {user_id} with role {role}.")
         return payload
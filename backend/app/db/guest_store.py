@@ -0,0 +1,286 @@
+# Redis-backed, TTL-expiring storage tier for anonymous (guest) conversations.
+# Guest turns are kept here instead of the Supabase 'conversations'/'messages'
+# tables and are only written to Supabase when the guest registers (promotion).
+# Redis is shared by all API workers, so any worker can serve a guest's requests.
+# Each guest also gets a small inverted index over their messages, so search
+# reads only the postings for the query terms and the messages on the page.
+
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Any, Optional, Tuple
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+from app.core.config import settings
+from app.db.redis_client import redis_client
+from app.utils.text_search import POSTING_SEPARATOR, parse_posting, posting_members, score
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "guest_history"
+# Sorted set of guest user IDs scored by last write time, used to cap session count
+SESSIONS_KEY = f"{KEY_PREFIX}:sessions"
+
+
+def _conversations_key(user_id: str) -> str:
+    # Hash: conversation_id -> JSON conversation summary
+    return f"{KEY_PREFIX}:{user_id}:conversations"
+
+
+def _messages_key(user_id: str) -> str:
+    # Hash: message_id -> JSON message record (same shape as 'messages' rows)
+    return f"{KEY_PREFIX}:{user_id}:messages"
+
+
+def _conversation_messages_key(user_id: str, conversation_id: str) -> str:
+    # List of the conversation's message IDs, oldest first
+    return f"{KEY_PREFIX}:{user_id}:conversation:{conversation_id}"
+
+
+def _index_key(user_id: str) -> str:
+    # Sorted set (all scores 0) of 'term|message_id|count|length' postings,
+    # so one term's postings are a ZRANGEBYLEX prefix range
+    return f"{KEY_PREFIX}:{user_id}:index"
+
+
+class GuestHistoryStore:
+    """
+    Bounded store of guest conversations, keyed by the anonymous user's ID.
+
+    Each guest session expires GUEST_HISTORY_TTL_SECONDS after its last write,
+    at most GUEST_HISTORY_MAX_SESSIONS sessions are held (least recently written
+    are evicted first), each session keeps its newest GUEST_HISTORY_MAX_CONVERSATIONS
+    conversations, and each conversation keeps its most recent
+    GUEST_HISTORY_MAX_MESSAGES messages. The search index follows the same
+    limits: postings are removed together with the messages they point to.
+    """
+
+    def __init__(
+        self,
+        redis: Redis,
+        max_sessions: int,
+        max_conversations: int,
+        max_messages: int,
+        ttl_seconds: int,
+    ):
+        self.redis = redis
+        self.max_sessions = max_sessions
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+
+    async def _delete_session(self, user_id: str) -> None:
+        conversation_ids = await self.redis.hkeys(_conversations_key(user_id))
+        keys = [_conversations_key(user_id), _messages_key(user_id), _index_key(user_id)]
+        keys += [_conversation_messages_key(user_id, cid) for cid in conversation_ids]
+        pipe = self.redis.pipeline()
+        pipe.delete(*keys)
+        pipe.zrem(SESSIONS_KEY, user_id)
+        await pipe.execute()
+
+    async def _remove_messages(self, user_id: str, message_ids: List[str]) -> None:
+        """Deletes message records and their index postings."""
+        if not message_ids:
+            return
+        raw_messages = await self.redis.hmget(_messages_key(user_id), message_ids)
+        postings = [
+            member
+            for message_id, raw in zip(message_ids, raw_messages) if raw is not None
+            for member in posting_members(message_id, json.loads(raw)["content"])
+        ]
+        pipe = self.redis.pipeline()
+        pipe.hdel(_messages_key(user_id), *message_ids)
+        if postings:
+            pipe.zrem(_index_key(user_id), *postings)
+        await pipe.execute()
+
+    def _queue_messages(self, pipe: Pipeline, user_id: str, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        """Queues the writes that append message records to a conversation and index them."""
+        if not messages:
+            return
+        pipe.hset(_messages_key(user_id), mapping={msg["id"]: json.dumps(msg) for msg in messages})
+        postings = {member: 0 for msg in messages for member in posting_members(msg["id"], msg["content"])}
+        if postings:
+            pipe.zadd(_index_key(user_id), postings)
+        pipe.rpush(_conversation_messages_key(user_id, conversation_id), *[msg["id"] for msg in messages])
+
+    async def _touch(self, user_id: str) -> None:
+        """Refreshes the session's TTL and evicts sessions beyond the global cap."""
+        conversation_ids = await self.redis.hkeys(_conversations_key(user_id))
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for key in (_conversations_key(user_id), _messages_key(user_id), _index_key(user_id)):
+            pipe.expire(key, self.ttl_seconds)
+        for cid in conversation_ids:
+            pipe.expire(_conversation_messages_key(user_id, cid), self.ttl_seconds)
+        pipe.zadd(SESSIONS_KEY, {user_id: now})
+        # Sessions whose keys have already expired no longer count towards the cap
+        pipe.zremrangebyscore(SESSIONS_KEY, "-inf", now - self.ttl_seconds)
+        pipe.zcard(SESSIONS_KEY)
+        results = await pipe.execute()
+
+        excess = results[-1] - self.max_sessions
+        if excess > 0:
+            for evicted_id, _ in await self.redis.zpopmin(SESSIONS_KEY, excess):
+                logger.info(f"Evicting guest session {evicted_id} (session limit reached).")
+                await self._delete_session(evicted_id)
+
+    async def create_conversation(self, user_id: str, conversation_id: str, title: str) -> Dict[str, Any]:
+        """Creates an empty guest conversation, evicting the guest's oldest ones beyond the cap."""
+        now = datetime.now(timezone.utc).isoformat()
+        conversation = {
+            "id": conversation_id,
+            "user_id": user_id,
+            "title": title,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.redis.hset(_conversations_key(user_id), conversation_id, json.dumps(conversation))
+
+        summaries = await self.redis.hgetall(_conversations_key(user_id))
+        if len(summaries) > self.max_conversations:
+            oldest = sorted(summaries.values(), key=lambda raw: json.loads(raw)["created_at"])
+            evicted = [json.loads(raw)["id"] for raw in oldest[:len(summaries) - self.max_conversations]]
+            pipe = self.redis.pipeline()
+            for cid in evicted:
+                pipe.lrange(_conversation_messages_key(user_id, cid), 0, -1)
+            message_id_lists = await pipe.execute()
+            await self._remove_messages(user_id, [mid for ids in message_id_lists for mid in ids])
+            pipe = self.redis.pipeline()
+            pipe.hdel(_conversations_key(user_id), *evicted)
+            pipe.delete(*[_conversation_messages_key(user_id, cid) for cid in evicted])
+            await pipe.execute()
+            logger.info(f"Evicted {len(evicted)} guest conversations for {user_id} (conversation limit reached).")
+
+        await self._touch(user_id)
+        return conversation
+
+    async def has_conversation(self, user_id: str, conversation_id: str) -> bool:
+        return bool(await self.redis.hexists(_conversations_key(user_id), conversation_id))
+
+    async def get_messages(self, user_id: str, message_ids: List[str]) -> List[Dict[str, Any]]:
+        """Returns message records by ID, in the given order; missing IDs are skipped."""
+        if not message_ids:
+            return []
+        raw_messages = await self.redis.hmget(_messages_key(user_id), message_ids)
+        return [json.loads(raw) for raw in raw_messages if raw is not None]
+
+    async def get_history(self, user_id: str, conversation_id: str) -> List[Dict[str, str]]:
+        """Returns the conversation history in the format expected by the LLM client."""
+        message_ids = await self.redis.lrange(_conversation_messages_key(user_id, conversation_id), 0, -1)
+        messages = await self.get_messages(user_id, message_ids)
+        return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+    async def add_messages(self, user_id: str, conversation_id: str, messages: List[Dict[str, Any]]) -> None:
+        """
+        Appends message records (same shape as rows in the 'messages' table)
+        to a guest conversation. Raises ValueError if the conversation is unknown
+        or has expired.
+        """
+        raw_summary = await self.redis.hget(_conversations_key(user_id), conversation_id)
+        if raw_summary is None:
+            raise ValueError("Conversation not found or has expired")
+
+        now = datetime.now(timezone.utc).isoformat()
+        summary = {**json.loads(raw_summary), "updated_at": now}
+        key = _conversation_messages_key(user_id, conversation_id)
+        pipe = self.redis.pipeline()
+        self._queue_messages(pipe, user_id, conversation_id, [{**msg, "created_at": now} for msg in messages])
+        # Keep only the most recent messages to bound memory per conversation;
+        # the pipeline is a transaction, so the range read is exactly what is trimmed
+        pipe.lrange(key, 0, -self.max_messages - 1)
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.hset(_conversations_key(user_id), conversation_id, json.dumps(summary))
+        results = await pipe.execute()
+        await self._remove_messages(user_id, results[-3])
+        await self._touch(user_id)
+
+    async def find_messages(self, user_id: str, terms: Iterable[str]) -> List[Tuple[float, str]]:
+        """
+        Returns (score, message_id) for messages containing every term, best
+        first and then by message ID. Only the index postings are read.
+        """
+        upper = chr(ord(POSTING_SEPARATOR) + 1)
+        pipe = self.redis.pipeline()
+        for term in terms:
+            pipe.zrangebylex(_index_key(user_id), f"[{term}{POSTING_SEPARATOR}", f"({term}{upper}")
+        matches: Optional[Dict[str, Tuple[int, int]]] = None  # message_id -> (count, length)
+        for postings in await pipe.execute():
+            counts = {message_id: (count, length) for message_id, count, length in map(parse_posting, postings)}
+            if matches is None:
+                matches = counts
+            else:
+                matches = {
+                    message_id: (count + counts[message_id][0], length)
+                    for message_id, (count, length) in matches.items() if message_id in counts
+                }
+        ranked = [(score(count, length), message_id) for message_id, (count, length) in (matches or {}).items()]
+        return sorted(ranked, key=lambda r: (-r[0], r[1]))
+
+    async def get_conversation_titles(self, user_id: str, conversation_ids: List[str]) -> Dict[str, str]:
+        """Returns {conversation_id: title} for the given conversations that still exist."""
+        if not conversation_ids:
+            return {}
+        raw_summaries = await self.redis.hmget(_conversations_key(user_id), conversation_ids)
+        return {cid: json.loads(raw)["title"] for cid, raw in zip(conversation_ids, raw_summaries) if raw is not None}
+
+    async def list_conversations(self, user_id: str) -> List[Dict[str, Any]]:
+        """Returns conversation summaries, newest first (same fields as the 'conversations' select)."""
+        summaries = [json.loads(raw) for raw in (await self.redis.hgetall(_conversations_key(user_id))).values()]
+        return [
+            {
+                "id": conv["id"],
+                "title": conv["title"],
+                "created_at": conv["created_at"],
+                "updated_at": conv["updated_at"],
+            }
+            for conv in sorted(summaries, key=lambda c: c["created_at"], reverse=True)
+        ]
+
+    async def get_session(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Returns all conversations (with their 'messages') for a guest; empty if none or expired."""
+        summaries = await self.redis.hgetall(_conversations_key(user_id))
+        if not summaries:
+            return {}
+        pipe = self.redis.pipeline()
+        for cid in summaries:
+            pipe.lrange(_conversation_messages_key(user_id, cid), 0, -1)
+        message_id_lists = await pipe.execute()
+        records = await self.get_messages(user_id, [mid for ids in message_id_lists for mid in ids])
+        messages = {msg["id"]: msg for msg in records}
+        return {
+            cid: {**json.loads(raw), "messages": [messages[mid] for mid in ids if mid in messages]}
+            for (cid, raw), ids in zip(summaries.items(), message_id_lists)
+        }
+
+    async def pop_session(self, user_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Removes and returns all conversations for a guest (used on promotion)."""
+        session = await self.get_session(user_id)
+        if not session:
+            return None
+        await self._delete_session(user_id)
+        return session
+
+    async def restore_session(self, user_id: str, conversations: Dict[str, Dict[str, Any]]) -> None:
+        """Puts back a session removed by pop_session (e.g. after a failed promotion)."""
+        pipe = self.redis.pipeline()
+        for cid, conv in conversations.items():
+            summary = {k: v for k, v in conv.items() if k != "messages"}
+            pipe.hset(_conversations_key(user_id), cid, json.dumps(summary))
+            self._queue_messages(pipe, user_id, cid, conv["messages"])
+        await pipe.execute()
+        await self._touch(user_id)
+
+
+guest_store = GuestHistoryStore(
+    redis=redis_client,
+    max_sessions=settings.GUEST_HISTORY_MAX_SESSIONS,
+    max_conversations=settings.GUEST_HISTORY_MAX_CONVERSATIONS,
+    max_messages=settings.GUEST_HISTORY_MAX_MESSAGES,
+    ttl_seconds=settings.GUEST_HISTORY_TTL_SECONDS,
+)
+
+def get_guest_store() -> GuestHistoryStore:
+    """Dependency function to get the guest history store."""
+    return guest_store
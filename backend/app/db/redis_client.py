@@ -0,0 +1,21 @@
+# Initializes the shared async Redis client (REDIS_HOST/REDIS_PORT).
+# Used for state that must be visible to every API worker, such as the
+# guest history tier.
+
+import redis.asyncio as redis
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Connections are opened lazily on first command, so this does not block startup
+redis_client: redis.Redis = redis.Redis(
+    host=settings.REDIS_HOST,
+    port=settings.REDIS_PORT,
+    decode_responses=True,
+)
+logger.info(f"Redis client configured for {settings.REDIS_HOST}:{settings.REDIS_PORT}.")
+
+def get_redis_client() -> redis.Redis:
+    """Dependency function to get the shared Redis client."""
+    return redis_client
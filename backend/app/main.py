@@ -4,6 +4,8 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.router import api_router
 from app.core.config import settings
+from app.core.profiling import PYINSTRUMENT_AVAILABLE, ProfilingMiddleware, profile_store
+from app.api.endpoints import profiling
 import logging
 
 # Configure logging
@@ -27,8 +29,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request profiling - only installed when a token is set, since captures can
+# only be downloaded with it
+if settings.PROFILING_TOKEN:
+    if PYINSTRUMENT_AVAILABLE:
+        app.add_middleware(ProfilingMiddleware, store=profile_store)
+        logging.info(f"Request profiling enabled (sample rate {settings.PROFILING_SAMPLE_RATE}).")
+    else:
+        logging.warning("Profiling is configured but pyinstrument is not installed; profiling disabled.")
+elif settings.PROFILING_SAMPLE_RATE > 0:
+    logging.warning("PROFILING_SAMPLE_RATE is set but PROFILING_TOKEN is not; profiling disabled.")
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
+app.include_router(profiling.router, prefix=f"{settings.API_V1_STR}/debug", tags=["debug"])
 
 # Health check endpoint
 @app.get("/health")
@@ -25,3 +25,18 @@ class ConversationListResponse(BaseModel):
     created_at: datetime
     updated_at: Optional[datetime] = None
 
+class GuestPromotionResponse(BaseModel):
+    promoted_conversations: int
+
+class SearchResult(BaseModel):
+    message_id: str
+    conversation_id: str
+    conversation_title: Optional[str] = None
+    role: str
+    created_at: Optional[datetime] = None
+    score: float
+    snippet: str
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,16 @@
+# Schemas for the request profiling debug endpoints
+
+from pydantic import BaseModel
+from datetime import datetime
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    status_code: int
+    started_at: datetime
+    wall_ms: float # Total request duration
+    process_cpu_ms: float # CPU time of the whole process while the request ran, not per-request
+    await_ms: float # Time the request's task spent suspended in await (I/O, DB, LLM)
+    active_ms: float # Time the request's task was running on the event loop
+    sample_count: int
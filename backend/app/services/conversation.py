@@ -1,22 +1,37 @@
 # Service layer for handling conversation logic.
 # Uses Supabase client for database interactions, relying on RLS for data scoping.
 # Removed dependencies on SQLAlchemy models and sessions.
+# Anonymous (guest) conversations are kept in the Redis-backed GuestHistoryStore
+# and only written to Supabase when the guest registers.
+# Message search uses Postgres full-text search via the search_messages RPC
+# (schema in README.md); guest history is searched in the guest store.
 
 from supabase import Client, PostgrestAPIResponse
 from app.llm.base import BaseLLMClient # Assuming this exists and is configured
-from app.schemas.conversation import ConversationResponse, MessageFormat # Define/adapt these schemas
-from typing import Optional, List, Dict, Any
+from fastapi import HTTPException
+from app.schemas.conversation import ConversationResponse # Define/adapt these schemas
+from typing import Optional, List, Dict, Any, Tuple
+import base64
+import bisect
+import json
 import uuid
 import structlog
 from app.llm.factory import get_llm_client # Assuming LLM factory exists
+from app.db.guest_store import GuestHistoryStore
+from app.utils.text_search import tokenize, make_snippet
+from postgrest.exceptions import APIError
 
 logger = structlog.get_logger(__name__)
 
+# Postgres error code raised by search_messages for stopword-only queries
+INVALID_SEARCH_QUERY_CODE = "22023"
+
 class ConversationService:
     """Service for managing conversations and messages using Supabase."""
 
-    def __init__(self, supabase_client: Client):
+    def __init__(self, supabase_client: Client, guest_store: GuestHistoryStore):
         self.db: Client = supabase_client
+        self.guest_store: GuestHistoryStore = guest_store
         # Get LLM client instance (specific provider based on config/request)
         # This might need adjustment based on how LLM selection is implemented (FR-13)
         self.llm_client: BaseLLMClient = get_llm_client() # Example: Get default client
@@ -35,10 +50,11 @@ class ConversationService:
             # Option 2: Filter explicitly by user_id here (less secure if RLS is the goal).
             # Let's implement Option 2 for now, assuming RLS is the primary guard on direct frontend access.
 
+            # Explicit user_id filter needed when using Service Role Key
             response: PostgrestAPIResponse = await self.db.table('messages')\
                 .select('role, content')\
                 .eq('conversation_id', conversation_id)\
-                .eq('user_id', user_id) # Explicit filter needed when using Service Role Key
+                .eq('user_id', user_id)\
                 .order('created_at', desc=False)\
                 .execute()
 
@@ -60,16 +76,28 @@ class ConversationService:
         user_id: str,
         message_content: str,
         conversation_id: Optional[str] = None,
+        is_anonymous: bool = False,
     ) -> ConversationResponse:
         """
         Processes a new message: gets history, calls LLM, saves messages, returns response.
+        Guest (anonymous) turns are stored in the Redis-backed guest tier instead of Supabase.
         """
-        log = logger.bind(user_id=user_id, conversation_id=conversation_id)
+        log = logger.bind(user_id=user_id, conversation_id=conversation_id, is_anonymous=is_anonymous)
         log.info("Processing new message.")
 
         history: List[Dict[str, str]] = []
-        if conversation_id:
+        if conversation_id and is_anonymous:
+            # Fail before calling the LLM if the guest conversation has expired
+            if not await self.guest_store.has_conversation(user_id, conversation_id):
+                raise ValueError("Conversation not found or has expired")
+            history = await self.guest_store.get_history(user_id, conversation_id)
+        elif conversation_id:
             history = await self._get_conversation_history(conversation_id, user_id)
+        elif is_anonymous:
+            conversation_id = str(uuid.uuid4())
+            await self.guest_store.create_conversation(user_id, conversation_id, title=message_content[:60])
+            log = log.bind(conversation_id=conversation_id)
+            log.info(f"Created new guest conversation with ID: {conversation_id}")
         else:
             # Create a new conversation if ID is not provided
             log.info("No conversation ID provided, creating new conversation.")
@@ -101,7 +129,7 @@ class ConversationService:
             raise HTTPException(status_code=502, detail="Failed to get response from AI model.")
 
 
-        # Save user message and AI response to Supabase
+        # Save user message and AI response (guest tier or Supabase)
         try:
             user_message_id = str(uuid.uuid4())
             assistant_message_id = str(uuid.uuid4())
@@ -126,12 +154,16 @@ class ConversationService:
                     }
                 }
             ]
-            response: PostgrestAPIResponse = await self.db.table('messages').insert(messages_to_insert).execute()
-            if not response.data or len(response.data) != 2:
-                 log.error("Failed to save messages to database.", response=response.error or response.status_code)
-                 # Decide handling: maybe retry, or raise error
-                 raise ValueError("Failed to save conversation turn.")
-            log.info("User and assistant messages saved successfully.")
+            if is_anonymous:
+                await self.guest_store.add_messages(user_id, conversation_id, messages_to_insert)
+                log.info("User and assistant messages saved to guest store.")
+            else:
+                response: PostgrestAPIResponse = await self.db.table('messages').insert(messages_to_insert).execute()
+                if not response.data or len(response.data) != 2:
+                     log.error("Failed to save messages to database.", response=response.error or response.status_code)
+                     # Decide handling: maybe retry, or raise error
+                     raise ValueError("Failed to save conversation turn.")
+                log.info("User and assistant messages saved successfully.")
 
         except Exception as e:
             log.error(f"Error saving messages to database: {e}", exc_info=True)
@@ -150,14 +182,18 @@ class ConversationService:
             disclaimer="This information is provided for general guidance only..." # Add full disclaimer
         )
 
-    async def get_user_conversations(self, user_id: str) -> List[Dict[str, Any]]:
+    async def get_user_conversations(self, user_id: str, is_anonymous: bool = False) -> List[Dict[str, Any]]:
         """Retrieves a list of conversations for the given user."""
-        log = logger.bind(user_id=user_id)
+        log = logger.bind(user_id=user_id, is_anonymous=is_anonymous)
         log.info("Fetching user conversations list.")
+        if is_anonymous:
+            conversations = await self.guest_store.list_conversations(user_id)
+            log.info(f"Found {len(conversations)} guest conversations.")
+            return conversations
         try:
              # RLS Note: Explicit user_id filter needed when using Service Role Key
             response: PostgrestAPIResponse = await self.db.table('conversations')\
-                .select('id, title, created_at, updated_at') # Select desired fields
+                .select('id, title, created_at, updated_at')\
                 .eq('user_id', user_id)\
                 .order('created_at', desc=True)\
                 .execute()
@@ -172,6 +208,139 @@ class ConversationService:
             raise HTTPException(status_code=500, detail="Could not retrieve conversation history.")
 
 
+    @staticmethod
+    def _encode_search_cursor(rank: float, message_id: str) -> str:
+        return base64.urlsafe_b64encode(json.dumps([rank, message_id]).encode()).decode()
+
+    @staticmethod
+    def _decode_search_cursor(cursor: str) -> Tuple[float, str]:
+        try:
+            rank, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            return float(rank), str(message_id)
+        except Exception:
+            raise ValueError("Invalid search cursor")
+
+    async def _search_guest_messages(
+        self, user_id: str, query: str, limit: int, after: Optional[Tuple[float, str]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Searches a guest's history using the guest store's inverted index; only
+        the messages on the requested page are read.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            raise ValueError("Search query must contain at least one searchable word")
+        ranked = await self.guest_store.find_messages(user_id, terms)
+        start = 0
+        if after:
+            start = bisect.bisect_right(ranked, (-after[0], after[1]), key=lambda r: (-r[0], r[1]))
+        page = ranked[start:start + limit]
+        messages = await self.guest_store.get_messages(user_id, [message_id for _, message_id in page])
+        titles = await self.guest_store.get_conversation_titles(
+            user_id, list({msg["conversation_id"] for msg in messages})
+        )
+        scores = {message_id: rank for rank, message_id in page}
+        return [
+            {
+                "message_id": msg["id"],
+                "conversation_id": msg["conversation_id"],
+                "conversation_title": titles.get(msg["conversation_id"]),
+                "role": msg["role"],
+                "created_at": msg["created_at"],
+                "score": scores[msg["id"]],
+                "snippet": make_snippet(msg["content"], terms),
+            }
+            for msg in messages
+        ]
+
+    async def search_messages(
+        self,
+        user_id: str,
+        query: str,
+        limit: int,
+        cursor: Optional[str] = None,
+        is_anonymous: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Full-text search over the user's own messages, ranked by relevance.
+        Returns a page of results with snippets and a keyset cursor on (rank, id)
+        for the next page. Ranks depend only on each message, so cursors stay
+        valid while new turns are saved and on any worker.
+        """
+        log = logger.bind(user_id=user_id, is_anonymous=is_anonymous)
+        after = self._decode_search_cursor(cursor) if cursor else None
+
+        # Fetch one extra row to know whether there is a next page
+        if is_anonymous:
+            rows = await self._search_guest_messages(user_id, query, limit + 1, after)
+        else:
+            try:
+                response: PostgrestAPIResponse = await self.db.rpc('search_messages', {
+                    "p_user_id": user_id,
+                    "p_query": query,
+                    "p_limit": limit + 1,
+                    "p_after_rank": after[0] if after else None,
+                    "p_after_id": after[1] if after else None,
+                }).execute()
+            except APIError as e:
+                if e.code == INVALID_SEARCH_QUERY_CODE:
+                    raise ValueError(e.message)
+                raise
+            rows = [{**row, "score": row.pop("rank")} for row in response.data or []]
+
+        page = rows[:limit]
+        next_cursor = None
+        if len(rows) > limit:
+            next_cursor = self._encode_search_cursor(page[-1]["score"], page[-1]["message_id"])
+        log.info("Search completed.", returned=len(page), has_more=next_cursor is not None)
+        return {"results": page, "next_cursor": next_cursor}
+
+    async def promote_guest_history(self, user_id: str) -> int:
+        """
+        Copies a former guest's conversations from the Redis-backed guest tier into Supabase.
+        Called once the anonymous user has registered (Supabase keeps the same
+        user ID when an anonymous user is converted). Returns the number of
+        conversations promoted.
+        """
+        log = logger.bind(user_id=user_id)
+        session = await self.guest_store.pop_session(user_id)
+        if not session:
+            log.info("No guest history to promote.")
+            return 0
+
+        conversations_to_insert = []
+        messages_to_insert = []
+        for conv in session.values():
+            conversations_to_insert.append({
+                "id": conv["id"],
+                "user_id": user_id,
+                "title": conv["title"],
+                "created_at": conv["created_at"],
+            })
+            messages_to_insert.extend(conv["messages"])
+
+        try:
+            response: PostgrestAPIResponse = await self.db.table('conversations')\
+                .upsert(conversations_to_insert)\
+                .execute()
+            if not response.data or len(response.data) != len(conversations_to_insert):
+                log.error("Failed to promote guest conversations.", response=response.error or response.status_code)
+                raise ValueError("Failed to promote guest conversations.")
+            if messages_to_insert:
+                # Upserts keep promotion idempotent if a previous attempt partially succeeded
+                response = await self.db.table('messages').upsert(messages_to_insert).execute()
+                if not response.data or len(response.data) != len(messages_to_insert):
+                    log.error("Failed to promote guest messages.", response=response.error or response.status_code)
+                    raise ValueError("Failed to promote guest messages.")
+        except Exception as e:
+            log.error(f"Error promoting guest history: {e}", exc_info=True)
+            # Put the session back so promotion can be retried before it expires
+            await self.guest_store.restore_session(user_id, session)
+            raise
+
+        log.info(f"Promoted {len(conversations_to_insert)} guest conversations to Supabase.")
+        return len(conversations_to_insert)
+
     async def track_interaction(self, user_id: str, conversation_id: str, tokens_used: Optional[Dict]):
         """Placeholder for tracking usage metrics (e.g., token counts)."""
         # This could write to a separate metrics table, call an external service, etc.
@@ -0,0 +1,112 @@
+# Lightweight text search helpers for guest history search.
+# Registered users' messages are searched in Postgres (see the search_messages
+# function in README.md). Guest history lives in Redis, where GuestHistoryStore
+# keeps a small per-guest inverted index built from these helpers. Terms are
+# stemmed so that, as with Postgres' 'english' configuration, "registering"
+# matches "registered"; scores depend only on the message itself (like
+# ts_rank_cd), so rankings stay stable between pages.
+
+from typing import Dict, Iterable, List, Tuple
+import math
+import re
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "how", "i",
+    "if", "in", "is", "it", "me", "my", "not", "of", "on", "or", "so", "that", "the",
+    "this", "to", "was", "what", "when", "where", "which", "who", "why", "with", "you", "your",
+})
+
+# Suffixes stripped by stem(), longest first; (suffix, replacement)
+_SUFFIXES = (
+    ("ational", "ate"), ("ations", ""), ("ation", ""), ("ements", ""), ("ement", ""),
+    ("ments", ""), ("ment", ""), ("ions", ""), ("ion", ""), ("ings", ""), ("ing", ""),
+    ("ies", "y"), ("ied", "y"), ("ers", ""), ("er", ""), ("ed", ""), ("es", ""),
+    ("ly", ""), ("s", ""),
+)
+_MIN_STEM = 3
+
+SNIPPET_RADIUS = 80  # Characters of context either side of the first match
+
+# Separator inside index postings; never produced by tokenize() or in message IDs
+POSTING_SEPARATOR = "|"
+
+
+def stem(word: str) -> str:
+    """
+    Reduces a lowercased word to a crude English stem, e.g. register, registered,
+    registering and registration all become 'regist'.
+    """
+    if word.isdigit():
+        return word
+    # Two passes so stacked suffixes reduce fully: registered -> register -> regist
+    for _ in range(2):
+        for suffix, replacement in _SUFFIXES:
+            if suffix == "s" and word.endswith("ss"):  # business, not busines
+                break
+            if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= _MIN_STEM:
+                word = word[:len(word) - len(suffix)] + replacement
+                break
+    # "registr(ation)" -> "regist", to meet "regist(er)"
+    if word.endswith("r") and len(word) > _MIN_STEM + 1 and word[-2] not in "aeiouy":
+        word = word[:-1]
+    if word.endswith("e") and len(word) > _MIN_STEM:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases, drops stopwords and stems text into searchable terms."""
+    return [stem(t) for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+def term_counts(content: str) -> Tuple[Dict[str, int], int]:
+    """Returns ({term: occurrences}, number of terms) for a message."""
+    counts: Dict[str, int] = {}
+    terms = tokenize(content)
+    for term in terms:
+        counts[term] = counts.get(term, 0) + 1
+    return counts, len(terms)
+
+
+def posting_members(message_id: str, content: str) -> List[str]:
+    """Encodes a message's index postings as 'term|message_id|count|length' members."""
+    counts, length = term_counts(content)
+    return [POSTING_SEPARATOR.join((term, message_id, str(count), str(length))) for term, count in counts.items()]
+
+
+def parse_posting(member: str) -> Tuple[str, int, int]:
+    """Decodes a posting member into (message_id, count, length)."""
+    _, message_id, count, length = member.split(POSTING_SEPARATOR)
+    return message_id, int(count), int(length)
+
+
+def score(total_count: int, length: int) -> float:
+    """More query-term occurrences in a shorter message score higher."""
+    return total_count / (1 + math.log(max(length, 1)))
+
+
+def make_snippet(content: str, terms: Iterable[str]) -> str:
+    """
+    Returns a short excerpt of content around the first word matching a query
+    term (by stem), with matches wrapped in ** like the ts_headline snippets for
+    registered users.
+    """
+    wanted = set(terms)
+    matches = [m for m in _TOKEN_RE.finditer(content) if stem(m.group().lower()) in wanted]
+    if not matches:
+        return content[:SNIPPET_RADIUS * 2].strip()
+    start = max(matches[0].start() - SNIPPET_RADIUS, 0)
+    end = min(matches[0].end() + SNIPPET_RADIUS, len(content))
+    pieces, position = [], start
+    for match in matches:
+        if match.end() > end:
+            break
+        pieces.append(content[position:match.start()] + f"**{match.group()}**")
+        position = match.end()
+    snippet = ("".join(pieces) + content[position:end]).strip()
+    if start > 0:
+        snippet = "..." + snippet
+    if end < len(content):
+        snippet = snippet + "..."
+    return snippet
@@ -0,0 +1,22 @@
+# Shared pytest fixtures. Settings require Supabase values at import time,
+# so placeholders are set before any app module is imported.
+
+import os
+
+os.environ.setdefault("SUPABASE_URL", "https://test.supabase.co")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "test-service-key")
+
+import fakeredis
+import pytest
+
+from app.db.guest_store import GuestHistoryStore
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+@pytest.fixture
+def guest_store(redis):
+    return GuestHistoryStore(redis, max_sessions=3, max_conversations=3, max_messages=4, ttl_seconds=60)
@@ -0,0 +1,100 @@
+# Tests for the Redis-backed guest history tier and guest promotion.
+
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+import app.services.conversation as conversation_module
+from app.db.guest_store import GuestHistoryStore
+from app.services.conversation import ConversationService
+
+
+def _turn(n: int):
+    return [
+        {"id": f"u{n}", "conversation_id": "c1", "user_id": "guest", "role": "user", "content": f"question {n}"},
+        {"id": f"a{n}", "conversation_id": "c1", "user_id": "guest", "role": "assistant", "content": f"answer {n}"},
+    ]
+
+
+async def test_session_expires_after_ttl(redis):
+    store = GuestHistoryStore(redis, max_sessions=3, max_conversations=3, max_messages=4, ttl_seconds=1)
+    await store.create_conversation("guest", "c1", "title")
+    await store.add_messages("guest", "c1", _turn(1))
+    assert await store.has_conversation("guest", "c1")
+
+    await asyncio.sleep(1.1)
+
+    assert not await store.has_conversation("guest", "c1")
+    assert await store.get_history("guest", "c1") == []
+    with pytest.raises(ValueError):
+        await store.add_messages("guest", "c1", _turn(2))
+
+
+async def test_write_refreshes_ttl_of_all_conversations(guest_store, redis):
+    await guest_store.create_conversation("guest", "c1", "first")
+    await guest_store.add_messages("guest", "c1", _turn(1))
+    for key in ("conversation:c1", "messages", "index"):
+        await redis.expire(f"guest_history:guest:{key}", 5)
+
+    await guest_store.create_conversation("guest", "c2", "second")
+
+    for key in ("conversation:c1", "messages", "index"):
+        assert await redis.ttl(f"guest_history:guest:{key}") == 60
+
+
+async def test_messages_are_trimmed_to_most_recent(guest_store):
+    await guest_store.create_conversation("guest", "c1", "title")
+    for n in range(3):
+        await guest_store.add_messages("guest", "c1", _turn(n))
+
+    history = await guest_store.get_history("guest", "c1")
+
+    assert [m["content"] for m in history] == ["question 1", "answer 1", "question 2", "answer 2"]
+
+
+async def test_oldest_conversations_evicted_beyond_cap(guest_store):
+    for n in range(5):
+        await guest_store.create_conversation("guest", f"c{n}", f"title {n}")
+        await asyncio.sleep(0.001)  # Distinct created_at timestamps
+
+    ids = [c["id"] for c in await guest_store.list_conversations("guest")]
+
+    assert ids == ["c4", "c3", "c2"]
+    assert not await guest_store.has_conversation("guest", "c0")
+
+
+async def test_least_recently_written_session_evicted_beyond_cap(guest_store):
+    for n in range(4):
+        await guest_store.create_conversation(f"guest{n}", "c1", "title")
+
+    assert not await guest_store.has_conversation("guest0", "c1")
+    assert await guest_store.has_conversation("guest3", "c1")
+
+
+async def test_restore_session_puts_back_popped_session(guest_store):
+    await guest_store.create_conversation("guest", "c1", "title")
+    await guest_store.add_messages("guest", "c1", _turn(1))
+
+    session = await guest_store.pop_session("guest")
+    assert await guest_store.list_conversations("guest") == []
+
+    await guest_store.restore_session("guest", session)
+
+    assert await guest_store.get_session("guest") == session
+
+
+async def test_promote_restores_session_when_upsert_fails(guest_store, monkeypatch):
+    monkeypatch.setattr(conversation_module, "get_llm_client", lambda: MagicMock())
+    await guest_store.create_conversation("guest", "c1", "title")
+    await guest_store.add_messages("guest", "c1", _turn(1))
+    before = await guest_store.get_session("guest")
+
+    db = MagicMock()
+    db.table.return_value.upsert.return_value.execute.side_effect = RuntimeError("upsert failed")
+    service = ConversationService(supabase_client=db, guest_store=guest_store)
+
+    with pytest.raises(RuntimeError):
+        await service.promote_guest_history("guest")
+
+    assert await guest_store.get_session("guest") == before
@@ -0,0 +1,66 @@
+# Tests for request profile capture and the profiling sample decision.
+
+import pytest
+
+from app.core.config import settings
+from app.core.profiling import ProfileStore, ProfilingMiddleware
+
+
+def _capture(capture_id: str, wall_ms: float):
+    return {"id": capture_id, "path": "/api/v1/message", "wall_ms": wall_ms, "session": object()}
+
+
+def _scope(path: str = "/api/v1/message", token: str | None = None):
+    headers = [(b"content-type", b"application/json")]
+    if token is not None:
+        headers.append((b"x-profile-token", token.encode()))
+    return {"type": "http", "method": "POST", "path": path, "headers": headers}
+
+
+@pytest.fixture
+def middleware(monkeypatch):
+    monkeypatch.setattr(settings, "PROFILING_TOKEN", "s3cret")
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+    return ProfilingMiddleware(app=None, store=ProfileStore(max_captures=3))
+
+
+def test_store_keeps_slowest_captures_when_evicting():
+    store = ProfileStore(max_captures=3)
+    for capture_id, wall_ms in [("a", 50), ("b", 10), ("c", 30), ("d", 40), ("e", 5), ("f", 60)]:
+        store.add(_capture(capture_id, wall_ms))
+
+    assert [c["id"] for c in store.list()] == ["f", "a", "d"]
+    assert store.get("b") is None
+
+
+def test_store_list_omits_raw_session():
+    store = ProfileStore(max_captures=1)
+    store.add(_capture("a", 10))
+
+    assert "session" not in store.list()[0]
+    assert "session" in store.get("a")
+
+
+def test_profiles_request_with_valid_token(middleware):
+    assert middleware._should_profile(_scope(token="s3cret"))
+
+
+def test_skips_request_with_invalid_token(middleware, monkeypatch):
+    # An invalid token is rejected even when every request would be sampled
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+    assert not middleware._should_profile(_scope(token="wrong"))
+
+
+def test_missing_token_falls_back_to_sample_rate(middleware, monkeypatch):
+    assert not middleware._should_profile(_scope())
+    monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 1.0)
+    assert middleware._should_profile(_scope())
+
+
+def test_debug_profile_endpoints_are_never_profiled(middleware):
+    assert not middleware._should_profile(_scope(path="/api/v1/debug/profiles", token="s3cret"))
+    assert not middleware._should_profile(_scope(path="/api/v1/debug/profiles/abc", token="s3cret"))
+
+
+def test_non_http_scopes_are_not_profiled(middleware):
+    assert not middleware._should_profile({"type": "lifespan"})
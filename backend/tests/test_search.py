@@ -0,0 +1,202 @@
+# Tests for conversation history search: the guest inverted index (ranking,
+# stemming, cleanup) and snippets, the Postgres search_messages RPC call,
+# cursor pagination and query validation.
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from postgrest.exceptions import APIError
+
+import app.services.conversation as conversation_module
+from app.api.deps import get_current_user_id, get_is_anonymous
+from app.api.endpoints.conversation import get_conversation_service, router
+from app.services.conversation import ConversationService
+from app.utils.text_search import make_snippet, stem
+
+
+def _message(message_id: str, content: str, role: str = "assistant"):
+    return {"id": message_id, "conversation_id": "c1", "user_id": "guest", "role": role, "content": content}
+
+
+@pytest.fixture
+def service(guest_store, monkeypatch):
+    monkeypatch.setattr(conversation_module, "get_llm_client", lambda: MagicMock())
+    return ConversationService(supabase_client=MagicMock(), guest_store=guest_store)
+
+
+def _rpc_returning(service, rows):
+    execute = AsyncMock(return_value=MagicMock(data=rows))
+    service.db.rpc.return_value.execute = execute
+    return service.db.rpc
+
+
+async def _index_members(redis):
+    return await redis.zrange("guest_history:guest:index", 0, -1)
+
+
+async def test_find_messages_requires_every_term(guest_store):
+    await guest_store.create_conversation("guest", "c1", "VAT")
+    await guest_store.add_messages("guest", "c1", [
+        _message("m1", "VAT registration threshold"),
+        _message("m2", "VAT returns are due monthly"),
+    ])
+
+    assert [mid for _, mid in await guest_store.find_messages("guest", ["vat", stem("registration")])] == ["m1"]
+
+
+async def test_find_messages_orders_by_score_then_message_id(guest_store):
+    await guest_store.create_conversation("guest", "c1", "VAT")
+    await guest_store.add_messages("guest", "c1", [
+        _message("m3", "VAT " * 2 + "registration"),
+        _message("m1", "VAT registration is required above the threshold for most freelancers in Kenya"),
+        _message("m2", "VAT registration"),
+    ])
+
+    ranked = await guest_store.find_messages("guest", ["vat", stem("registration")])
+
+    # More matches in a shorter message rank higher; equal scores fall back to ID order
+    assert [message_id for _, message_id in ranked] == ["m3", "m2", "m1"]
+
+
+def test_stem_conflates_word_forms():
+    assert {stem(w) for w in ["register", "registered", "registering", "registration"]} == {"regist"}
+    assert stem("businesses") == stem("business")
+    assert stem("2024") == "2024"
+
+
+async def test_guest_search_matches_other_word_forms(service, guest_store):
+    await guest_store.create_conversation("guest", "c1", "VAT chat")
+    await guest_store.add_messages("guest", "c1", [
+        _message("m1", "Registration for VAT takes two weeks"),
+        _message("m2", "You registered for PAYE last year"),
+        _message("m3", "Filing deadlines"),
+    ])
+
+    results = (await service.search_messages("guest", "register", limit=10, is_anonymous=True))["results"]
+
+    assert sorted(r["message_id"] for r in results) == ["m1", "m2"]
+    assert results[0]["conversation_title"] == "VAT chat"
+    assert "**Registration**" in next(r["snippet"] for r in results if r["message_id"] == "m1")
+
+
+async def test_guest_search_reads_only_page_messages(service, guest_store, monkeypatch):
+    await guest_store.create_conversation("guest", "c1", "VAT chat")
+    await guest_store.add_messages("guest", "c1", [_message(f"m{n}", f"VAT note {n}") for n in range(3)])
+    get_messages = AsyncMock(wraps=guest_store.get_messages)
+    monkeypatch.setattr(guest_store, "get_messages", get_messages)
+
+    page = await service.search_messages("guest", "vat", limit=1, is_anonymous=True)
+
+    assert len(page["results"]) == 1
+    # limit + 1 IDs: the extra one tells the service there is a next page
+    assert len(get_messages.call_args.args[1]) == 2
+
+
+async def test_index_entries_removed_when_messages_trimmed(guest_store, redis):
+    await guest_store.create_conversation("guest", "c1", "VAT")
+    await guest_store.add_messages("guest", "c1", [_message("m0", "penalty"), _message("m1", "deadline")])
+    await guest_store.add_messages("guest", "c1", [_message(f"m{n}", f"note {n}") for n in range(2, 5)])
+
+    assert await guest_store.find_messages("guest", ["penalty"]) == []
+    assert not any("|m0|" in member for member in await _index_members(redis))
+    assert not await redis.hexists("guest_history:guest:messages", "m0")
+
+
+async def test_index_entries_removed_with_evicted_conversation(guest_store, redis):
+    await guest_store.create_conversation("guest", "c0", "old")
+    await guest_store.add_messages("guest", "c0", [_message("m0", "penalty")])
+    for n in range(1, 4):
+        await guest_store.create_conversation("guest", f"c{n}", "newer")
+
+    assert await guest_store.find_messages("guest", ["penalty"]) == []
+    assert await _index_members(redis) == []
+
+
+async def test_index_removed_with_session(guest_store, redis):
+    await guest_store.create_conversation("guest", "c1", "VAT")
+    await guest_store.add_messages("guest", "c1", [_message("m1", "penalty")])
+
+    await guest_store.pop_session("guest")
+
+    assert await redis.keys("guest_history:guest:*") == []
+
+
+def test_make_snippet_marks_matches_and_trims_around_first_match():
+    content = "x" * 200 + " VAT registration is due " + "y" * 200
+
+    snippet = make_snippet(content, ["vat"])
+
+    assert snippet.startswith("...") and snippet.endswith("...")
+    assert "**VAT** registration" in snippet
+    assert len(snippet) < len(content)
+
+
+def test_make_snippet_without_match_returns_start_of_content():
+    assert make_snippet("Short answer.", ["vat"]) == "Short answer."
+
+
+async def test_guest_cursor_pagination_stable_when_turns_added(service, guest_store):
+    await guest_store.create_conversation("guest", "c1", "VAT chat")
+    await guest_store.add_messages("guest", "c1", [_message(f"m{n}", f"VAT registration note {n}") for n in range(3)])
+
+    first = await service.search_messages("guest", "vat registration", limit=1, is_anonymous=True)
+    # A new turn arriving between pages must not cause repeats or gaps
+    await guest_store.add_messages("guest", "c1", [_message("m9", "another VAT registration question")])
+    seen = [r["message_id"] for r in first["results"]]
+    cursor = first["next_cursor"]
+    while cursor:
+        page = await service.search_messages("guest", "vat registration", limit=1, cursor=cursor, is_anonymous=True)
+        seen += [r["message_id"] for r in page["results"]]
+        cursor = page["next_cursor"]
+
+    assert len(seen) == len(set(seen))
+    assert {f"m{n}" for n in range(3)} <= set(seen)
+
+
+async def test_rpc_search_passes_keyset_cursor(service):
+    rpc = _rpc_returning(service, [
+        {"message_id": "m1", "conversation_id": "c1", "conversation_title": "VAT", "role": "assistant",
+         "created_at": "2024-01-01T00:00:00+00:00", "rank": 0.3, "snippet": "**VAT**"},
+        {"message_id": "m2", "conversation_id": "c1", "conversation_title": "VAT", "role": "user",
+         "created_at": "2024-01-01T00:00:00+00:00", "rank": 0.1, "snippet": "**VAT**"},
+    ])
+
+    first = await service.search_messages("user-1", "vat", limit=1)
+
+    assert [r["message_id"] for r in first["results"]] == ["m1"]
+    assert first["results"][0]["score"] == 0.3
+    assert rpc.call_args.args[1] == {
+        "p_user_id": "user-1", "p_query": "vat", "p_limit": 2, "p_after_rank": None, "p_after_id": None,
+    }
+
+    _rpc_returning(service, [])
+    second = await service.search_messages("user-1", "vat", limit=1, cursor=first["next_cursor"])
+
+    assert second == {"results": [], "next_cursor": None}
+    assert rpc.call_args.args[1]["p_after_rank"] == 0.3
+    assert rpc.call_args.args[1]["p_after_id"] == "m1"
+
+
+async def test_invalid_cursor_raises_value_error(service):
+    with pytest.raises(ValueError):
+        await service.search_messages("user-1", "vat", limit=1, cursor="not-a-cursor")
+
+
+@pytest.mark.parametrize("is_anonymous", [True, False])
+def test_stopword_only_query_returns_400(service, is_anonymous):
+    service.db.rpc.return_value.execute = AsyncMock(side_effect=APIError({
+        "code": "22023", "message": "Search query must contain at least one searchable word",
+        "details": None, "hint": None,
+    }))
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_current_user_id] = lambda: "user-1"
+    app.dependency_overrides[get_is_anonymous] = lambda: is_anonymous
+    app.dependency_overrides[get_conversation_service] = lambda: service
+
+    response = TestClient(app).get("/conversations/search", params={"q": "the and of"})
+
+    assert response.status_code == 400
+    assert "searchable word" in response.json()["detail"]
@@ -19,7 +19,7 @@ export default function AboutPage() {
         <li>Provide structured information on tax categories, deductions, and deadlines.</li>
         <li>Remember conversation context for follow-up questions.</li>
         <li>Allow selection between different powerful AI models (like Gemini, ChatGPT, Claude).</li>
-        <li>Offer persistent chat history (device-specific for guests, cloud-synced for registered users).</li>
+        <li>Offer persistent chat history (temporary for guests and moved into their account on sign-up, cloud-synced for registered users).</li>
       </ul>
 
       <h2>How it Works</h2>
@@ -57,6 +57,7 @@ export const GuestPrompt: React.FC = () => {
       } else {
         // Success! The onAuthStateChange listener in AuthContext should handle the state update.
         console.log("Anonymous user linked successfully.");
+        // Guest history is promoted by AuthContext once the account is confirmed.
         setIsSignupModalOpen(false); // Close modal on success
       }
     } catch (err: any) {
@@ -76,7 +77,7 @@ export const GuestPrompt: React.FC = () => {
     <>
       <div className="guest-banner bg-yellow-100 border border-yellow-300 p-3 text-center text-sm sticky top-0 z-40 shadow-sm">
         <span>
-          You're using PawaIT as a guest (history is device-specific).{' '}
+          You're using PawaIT as a guest (your chat history expires after a period of inactivity).{' '}
         </span>
         <button
           onClick={() => setIsSignupModalOpen(true)}
@@ -85,7 +86,7 @@ export const GuestPrompt: React.FC = () => {
           Sign up
         </button>
         <span>
-          {' '}to save your chats across devices!
+          {' '}to keep it: your guest chats are moved into your account.
         </span>
       </div>
 
@@ -1,9 +1,10 @@
 // Provides authentication state and functions using Supabase.
 // Manages user session, loading state, and provides auth methods.
 
-import React, { createContext, useState, useEffect, useContext, ReactNode } from 'react';
-import { Session, User, AuthError, Provider } from '@supabase/supabase-js';
+import React, { createContext, useState, useEffect, useContext, useCallback, useRef, ReactNode } from 'react';
+import { Session, User, AuthError, Provider, AuthChangeEvent } from '@supabase/supabase-js';
 import { supabase } from '@/lib/supabaseClient'; // Import Supabase client
+import { apiClient } from '@/services/apiClient';
 import { useRouter } from 'next/navigation'; // Use next/navigation for App Router
 
 interface AuthContextData {
@@ -17,8 +18,20 @@ interface AuthContextData {
   signOut: () => Promise<{ error: AuthError | null }>;
   signUp: (email: string, password: string) => Promise<{ error: AuthError | null }>;
   updateUserCredentials: (email?: string, password?: string) => Promise<{ error: AuthError | null }>; // For linking anonymous
+  guestPromotionError: string | null; // Set if guest history could not be saved to the account
+  retryGuestPromotion: () => Promise<void>;
 }
 
+// Guest history lives in a temporary backend tier until the guest registers.
+// The guest's user ID is remembered here so promotion is retried (including after
+// a reload) until the backend accepts it - Supabase only makes a linked anonymous
+// user permanent once the email is confirmed, so early attempts return 403.
+const PENDING_PROMOTION_KEY = 'pawait_pending_guest_promotion';
+const PROMOTION_MAX_ATTEMPTS = 3;
+const PROMOTION_RETRY_DELAY_MS = 2000;
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms));
+
 const AuthContext = createContext<AuthContextData | undefined>(undefined);
 
 interface AuthProviderProps {
@@ -29,8 +42,58 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
   const [session, setSession] = useState<Session | null>(null);
   const [user, setUser] = useState<User | null>(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [guestPromotionError, setGuestPromotionError] = useState<string | null>(null);
+  const isPromotingRef = useRef(false); // Several auth events can fire back to back
   const router = useRouter();
 
+  // Moves a former guest's history into their account. Returns when it has either
+  // succeeded, is not possible yet (token still anonymous), or failed for good.
+  const promoteGuestHistory = useCallback(async (currentUser: User | null) => {
+    const pendingUserId = localStorage.getItem(PENDING_PROMOTION_KEY);
+    if (!currentUser || currentUser.is_anonymous || pendingUserId !== currentUser.id || isPromotingRef.current) {
+      return;
+    }
+    isPromotingRef.current = true;
+    try {
+      for (let attempt = 1; attempt <= PROMOTION_MAX_ATTEMPTS; attempt++) {
+        try {
+          const { data } = await apiClient.post('/conversations/promote');
+          console.log("Guest history saved to account:", data?.promoted_conversations);
+          localStorage.removeItem(PENDING_PROMOTION_KEY);
+          setGuestPromotionError(null);
+          return;
+        } catch (err: any) {
+          if (err.response?.status === 403) {
+            // Account not confirmed yet; the next auth state change will try again
+            console.info("Guest promotion deferred until the account is confirmed.");
+            return;
+          }
+          console.error(`Guest promotion attempt ${attempt} failed:`, err);
+          if (attempt < PROMOTION_MAX_ATTEMPTS) await sleep(PROMOTION_RETRY_DELAY_MS * attempt);
+        }
+      }
+      setGuestPromotionError("We couldn't save your guest conversations to your account.");
+    } finally {
+      isPromotingRef.current = false;
+    }
+  }, []);
+
+  const handleAuthChange = useCallback((event: AuthChangeEvent | 'INITIAL', sessionUser: User | null) => {
+    if (sessionUser?.is_anonymous) {
+      // Remember the guest so their history can be promoted after they register
+      localStorage.setItem(PENDING_PROMOTION_KEY, sessionUser.id);
+    } else if (['INITIAL', 'INITIAL_SESSION', 'SIGNED_IN', 'USER_UPDATED', 'TOKEN_REFRESHED'].includes(event)) {
+      void promoteGuestHistory(sessionUser);
+    }
+  }, [promoteGuestHistory]);
+
+  const retryGuestPromotion = useCallback(async () => {
+    setGuestPromotionError(null);
+    // Pick up a freshly confirmed account before retrying
+    const { data: { session: refreshed } } = await supabase.auth.refreshSession();
+    await promoteGuestHistory(refreshed?.user ?? user);
+  }, [promoteGuestHistory, user]);
+
   useEffect(() => {
     let isMounted = true;
     setIsLoading(true);
@@ -44,6 +107,7 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
          setSession(initialSession);
          setUser(initialSession?.user ?? null);
          setIsLoading(false);
+         handleAuthChange('INITIAL', initialSession?.user ?? null);
        }
     }).catch(err => {
         if (isMounted) {
@@ -60,6 +124,7 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
             console.log("Auth state changed:", _event, sessionState?.user?.id, sessionState?.user?.role);
             setSession(sessionState);
             setUser(sessionState?.user ?? null);
+            handleAuthChange(_event, sessionState?.user ?? null);
             // Ensure loading is false once we have definitive state
             if (isLoading) setIsLoading(false);
          }
@@ -158,11 +223,19 @@ export const AuthProvider: React.FC<AuthProviderProps> = ({ children }) => {
     signOut,
     signUp,
     updateUserCredentials,
+    guestPromotionError,
+    retryGuestPromotion,
   };
 
   // Don't render children until initial auth check is complete
   return (
     <AuthContext.Provider value={value}>
+      {guestPromotionError && (
+        <div role="alert" className="bg-red-100 text-red-700 p-3 text-center text-sm">
+          {guestPromotionError}{' '}
+          <button onClick={retryGuestPromotion} className="underline font-medium">Try again</button>
+        </div>
+      )}
       {isLoading ? <div>Loading Authentication...</div> : children}
     </AuthContext.Provider>
   );